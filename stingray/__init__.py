@@ -9,20 +9,155 @@ from ._astropy_init import *
 
 # For egg_info test builds to pass, put package imports here.
 if not _ASTROPY_SETUP_:
-    from stingray.base import *
-    from stingray.events import *
-    from stingray.lightcurve import *
-    from stingray.utils import *
-    from stingray.lombscargle import *
-    from stingray.powerspectrum import *
-    from stingray.crossspectrum import *
-    from stingray.multitaper import *
-    from stingray import *
-    from stingray.exceptions import *
-    from stingray.covariancespectrum import *
-    from stingray.crosscorrelation import *
-    from stingray.stats import *
-    from stingray.bispectrum import *
-    from stingray.varenergyspectrum import *
-    from stingray.lombscargle import *
-    from stingray.loggingconfig import *
+    # Public names of the package, by submodule. Submodules are only imported the
+    # first time one of their names is accessed (PEP 562), so that, e.g.,
+    # ``from stingray import Lightcurve`` does not pay for the dependencies of
+    # all the other submodules.
+    _PUBLIC_NAMES = {
+        "base": [
+            "convert_table_attrs_to_lowercase",
+            "interpret_times",
+            "reduce_precision_if_extended",
+            "StingrayObject",
+            "StingrayTimeseries",
+        ],
+        "events": ["EventList"],
+        "lightcurve": ["Lightcurve"],
+        "utils": [
+            "simon",
+            "rebin_data",
+            "rebin_data_log",
+            "look_for_array_in_array",
+            "is_string",
+            "is_iterable",
+            "order_list_of_arrays",
+            "optimal_bin_time",
+            "contiguous_regions",
+            "is_int",
+            "get_random_state",
+            "baseline_als",
+            "excess_variance",
+            "create_window",
+            "poisson_symmetrical_errors",
+            "standard_error",
+            "nearest_power_of_two",
+            "find_nearest",
+            "check_isallfinite",
+            "heaviside",
+        ],
+        "lombscargle": ["LombScarglePowerspectrum", "LombScargleCrossspectrum"],
+        "powerspectrum": ["Powerspectrum", "AveragedPowerspectrum", "DynamicalPowerspectrum"],
+        "crossspectrum": [
+            "Crossspectrum",
+            "AveragedCrossspectrum",
+            "DynamicalCrossspectrum",
+            "cospectra_pvalue",
+            "normalize_crossspectrum",
+            "time_lag",
+            "coherence",
+            "get_flux_generator",
+        ],
+        "multitaper": ["Multitaper"],
+        "exceptions": ["StingrayError"],
+        "covariancespectrum": ["Covariancespectrum", "AveragedCovariancespectrum"],
+        "crosscorrelation": ["CrossCorrelation", "AutoCorrelation"],
+        "stats": [
+            "p_multitrial_from_single_trial",
+            "p_single_trial_from_p_multitrial",
+            "fold_profile_probability",
+            "fold_profile_logprobability",
+            "fold_detection_level",
+            "phase_dispersion_detection_level",
+            "phase_dispersion_probability",
+            "phase_dispersion_logprobability",
+            "pds_probability",
+            "pds_detection_level",
+            "z2_n_detection_level",
+            "z2_n_probability",
+            "z2_n_logprobability",
+            "classical_pvalue",
+            "chi2_logp",
+            "equivalent_gaussian_Nsigma",
+            "equivalent_gaussian_Nsigma_from_logp",
+            "power_confidence_limits",
+            "power_upper_limit",
+            "pf_from_ssig",
+            "pf_from_a",
+            "pf_upper_limit",
+            "a_from_pf",
+            "a_from_ssig",
+            "ssig_from_a",
+            "ssig_from_pf",
+            "amplitude_upper_limit",
+        ],
+        "bispectrum": ["Bispectrum"],
+        "varenergyspectrum": [
+            "VarEnergySpectrum",
+            "RmsEnergySpectrum",
+            "RmsSpectrum",
+            "LagEnergySpectrum",
+            "LagSpectrum",
+            "ExcessVarianceSpectrum",
+            "CovarianceSpectrum",
+            "ComplexCovarianceSpectrum",
+            "CountSpectrum",
+        ],
+        # loggingconfig has no __all__: its star import also exported the logging module
+        "loggingconfig": ["CustomFormatter", "setup_logger", "logger", "logging"],
+    }
+
+    _submodule_of = {
+        name: submodule for submodule, names in _PUBLIC_NAMES.items() for name in names
+    }
+
+    # Submodules that ``from stingray import *`` binds, as it did when they were all
+    # imported eagerly
+    _SUBMODULES = [
+        "base",
+        "bexvar",
+        "bispectrum",
+        "covariancespectrum",
+        "crosscorrelation",
+        "crossspectrum",
+        "events",
+        "exceptions",
+        "filters",
+        "fourier",
+        "gti",
+        "io",
+        "lightcurve",
+        "loggingconfig",
+        "lombscargle",
+        "multitaper",
+        "power_colors",
+        "powerspectrum",
+        "stats",
+        "utils",
+        "varenergyspectrum",
+    ]
+
+    __all__ = ["__version__", "test"] + list(_submodule_of) + _SUBMODULES
+
+    def __getattr__(name):
+        import importlib
+
+        if name in _submodule_of:
+            module = importlib.import_module(f"{__name__}.{_submodule_of[name]}")
+            if name == "logger":
+                # The logger is None until the first call to setup_logger
+                value = module.setup_logger()
+            else:
+                value = getattr(module, name)
+            globals()[name] = value
+            return value
+
+        # Submodules, e.g. ``stingray.gti``, are also accessible as attributes
+        try:
+            return importlib.import_module(f"{__name__}.{name}")
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(globals()) | set(__all__))
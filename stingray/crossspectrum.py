@@ -6,7 +6,6 @@ import numpy as np
 import scipy
 import scipy.optimize
 import scipy.stats
-import matplotlib.pyplot as plt
 
 from stingray.exceptions import StingrayError
 from stingray.utils import rebin_data, rebin_data_log, simon
@@ -1071,6 +1070,7 @@ class Crossspectrum(StingrayObject):
         ax : ``matplotlib.Axes`` object
             An axes object to fill with the cross correlation plot.
         """
+        import matplotlib.pyplot as plt
 
         if ax is None:
             fig = plt.figure("crossspectrum")
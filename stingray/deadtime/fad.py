@@ -1,7 +1,6 @@
 import warnings
 import numpy as np
 import scipy
-import matplotlib.pyplot as plt
 
 from scipy.ndimage import gaussian_filter1d
 from scipy.interpolate import UnivariateSpline
@@ -144,6 +143,8 @@ def FAD(
 
     if plot:
         if ax is None:
+            import matplotlib.pyplot as plt
+
             fig, ax = plt.subplots()
 
     for flux1, flux2 in show_progress(zip(flux_iterable1, flux_iterable2)):
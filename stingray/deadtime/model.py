@@ -1,22 +1,21 @@
+import math
 import warnings
 from stingray.utils import njit, prange
 
 from stingray.loggingconfig import setup_logger
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.special import factorial
+from scipy.special import gammaincc
+from scipy.fft import rfft
 from scipy.interpolate import interp1d
 
 logger = setup_logger()
 
-MAX_FACTORIAL = 100
-__INVERSE_FACTORIALS = 1.0 / factorial(np.arange(MAX_FACTORIAL))
 PRECISION = np.finfo(float).precision
-TWOPI = np.pi * 2
-
-STERLING_PARAMETERS = np.array([1 / 12, 1 / 288, -139 / 51840, -571 / 2488320])
+SMALLEST_NORMAL_FLOAT = np.finfo(float).tiny
+# Relative size of a new term in Gn below which the series is truncated
+_GN_TOL = 10.0 ** (-PRECISION)
 
 __all__ = [
     "r_det",
@@ -28,62 +27,6 @@ __all__ = [
 ]
 
 
-@njit()
-def _stirling_factor(m):
-    """First few terms of series expansion appearing in Stirling's approximation."""
-    fact = 1.0
-    power = 1.0
-    for i in range(1, 5):
-        power *= m
-        fact += STERLING_PARAMETERS[i - 1] / power
-    return fact
-
-
-@njit()
-def e_m_x_x_over_factorial(x: float, m: int):
-    r"""Approximate the large number ratio in Eq. 34.
-
-    The original formula for :math:`G_n` (eq. 34 in Zhang+95) has factors of the kind
-    :math:`e^{-x} x^l / l!`. This is the product of very large numbers, that mostly
-    balance each other. In this function, we approximate this product for large :math:`l`
-    starting from Stirling's approximation for the factorial:
-
-    .. math::
-
-       l! \approx \sqrt{2\pi l} (\frac{l}{e})^l A(l)
-
-    where :math:`A(l)` is a series expansion in 1/l of the form
-    :math:`1 + 1 / 12l + 1 / 288l^2 - 139/51840/l^3 + ...`. This allows to transform the product
-    above into
-
-    .. math::
-
-       \frac{e^{-x} x^l}{l!} \approx \frac{1}{A(l)\sqrt{2\pi l}}\left(\frac{x e}{l}\right)^l e^{-x}
-
-    and then, bringing the exponential into the parenthesis
-
-    .. math::
-
-       \frac{e^{-x} x^l}{l!}\approx\frac{1}{A(l)\sqrt{2\pi l}} \left(\frac{x e^{1-x/l}}{l}\right)^l
-
-    The function inside the brackets has a maximum around :math:`x \approx l` and is well-behaved,
-    allowing to approximate the product for large :math:`l` without the need to calculate the
-    factorial or the exponentials directly.
-    """
-    # Numerical errors occur when x is not a float
-    x = float(x)
-
-    if x == 0.0 and m == 0:
-        return 1.0
-
-    # For decently small numbers, use the direct formula
-    if m < 50 or (x > 1 and m * max(np.log10(x), 1) < 50):
-        return np.exp(-x) * x**m * __INVERSE_FACTORIALS[m]
-
-    # Use Stirling's approximation
-    return 1.0 / np.sqrt(TWOPI * m) * np.power(x * np.exp(1 - x / m) / m, m) / _stirling_factor(m)
-
-
 def r_in(td, r_0):
     """Calculate incident countrate given dead time and detected countrate.
 
@@ -94,8 +37,7 @@ def r_in(td, r_0):
     r_0 : float
         Detected countrate
     """
-    tau = 1 / r_0
-    return 1.0 / (tau - td)
+    return r_0 / (1.0 - td * r_0)
 
 
 def r_det(td, r_i):
@@ -108,27 +50,68 @@ def r_det(td, r_i):
     r_i : float
         Incident countrate
     """
-    tau = 1 / r_i
-    return 1.0 / (tau + td)
+    return r_i / (1.0 + td * r_i)
+
+
+@njit(cache=True)
+def _poisson_term_log(x, m):
+    """Calculate :math:`e^{-x} x^m / m!` in log space, avoiding the underflow of :math:`e^{-x}`."""
+    return math.exp(-x + m * math.log(x) - math.lgamma(m + 1))
+
 
+@njit(cache=True)
+def _Gn_step(x, m, n, p, s):
+    """Add the m-th term to the sum in `_Gn`.
 
-@njit()
+    Returns the next Poisson term, the updated sum, and whether the sum has converged.
+    """
+    if p < SMALLEST_NORMAL_FLOAT and x > 0.0:
+        # exp(-x) is subnormal or zero for large x, and has lost most of its significant
+        # digits. Calculate the term in log space instead
+        p = _poisson_term_log(x, m)
+
+    new_val = p * (n - m)
+
+    s += new_val
+    # The Poisson terms peak near m ~ x: only truncate well past the peak, when they are
+    # decreasing and cannot contribute significantly anymore
+    if x != 0 and m > 2 * x and abs(new_val) < _GN_TOL * abs(s):
+        return p, s, True
+
+    if p < SMALLEST_NORMAL_FLOAT:
+        # Never start the recurrence from a subnormal term: the next one will be
+        # calculated in log space as well
+        return 0.0, s, False
+
+    return p * x / (m + 1), s, False
+
+
+@njit(cache=True)
 def _Gn(x, n):
-    """Term in Eq. 34 in Zhang+95."""
+    """Term in Eq. 34 in Zhang+95.
+
+    The Poisson terms :math:`e^{-x} x^m / m!` are calculated with the recurrence
+    :math:`p_{m+1} = p_m x / (m + 1)`, starting from :math:`p_0 = e^{-x}`. Terms
+    below the smallest normal float are calculated in log space instead.
+    """
     s = 0.0
+    p = math.exp(-x)
 
     for m in range(0, n):
-        new_val = e_m_x_x_over_factorial(x, m) * (n - m)
-
-        s += new_val
-        # The curve above has a maximum around x~l
-        if x != 0 and s > 0 and m > 2 * x and -np.log10(np.abs(new_val / s)) > PRECISION:
+        p, s, converged = _Gn_step(x, m, n, p, s)
+        if converged:
             break
 
     return s
 
 
-@njit()
+@njit(cache=True)
+def _h_from_Gn(k, n, Gn, td, tb, tau):
+    """Term in Eq. 35 in Zhang+95, given the value of Gn."""
+    return k - n * (td + tau) / tb + tau / tb * Gn
+
+
+@njit(cache=True)
 def _h(k, n, td, tb, tau):
     """Term in Eq. 35 in Zhang+95."""
     # Typo in Zhang+95 corrected. k * tb, not k * td
@@ -137,15 +120,113 @@ def _h(k, n, td, tb, tau):
     if k * tb - n * td < 0:
         return 0.0
 
-    val = k - n * (td + tau) / tb + tau / tb * _Gn(factor / tau, n)
+    return _h_from_Gn(k, n, _Gn(factor / tau, n), td, tb, tau)
+
+
+@njit(cache=True)
+def _A0_n_bound(td, tb):
+    """Upper bound (excluded) of the sum over n in Eq. 38 in Zhang+95."""
+    return int(max(2.0, tb / td * 2 + 1))
+
+
+@njit(cache=True)
+def _A_n_bound(k, td, tb):
+    """Upper bound (excluded) of the sum over n in Eq. 39 in Zhang+95."""
+    return int(max(3.0, (k + 1) * tb / td * 2))
+
+
+@njit(cache=True)
+def _A_inner(k, td, tb, tau):
+    """Sum over n in Eq. 39 in Zhang+95, for k > 0.
+
+    The terms :math:`h(k + 1, n)`, :math:`h(k, n)` and :math:`h(k - 1, n)` have the same
+    :math:`n`, so their three values of Gn are calculated in a single loop over :math:`m`.
+    """
+    s = 0.0
+    n_bound = _A_n_bound(k, td, tb)
+    for n in range(1, n_bound):
+        factor_plus = (k + 1) * tb - n * td
+        factor_0 = k * tb - n * td
+        factor_minus = (k - 1) * tb - n * td
+        # All h terms are zero from here on
+        if factor_plus < 0:
+            break
+
+        x_plus = factor_plus / tau
+        x_0 = factor_0 / tau
+        x_minus = factor_minus / tau
+
+        # h is zero for negative factors: consider those sums converged from the start
+        done_plus = False
+        done_0 = factor_0 < 0
+        done_minus = factor_minus < 0
+
+        g_plus = g_0 = g_minus = 0.0
+        p_plus = math.exp(-x_plus)
+        p_0 = math.exp(-x_0) if not done_0 else 0.0
+        p_minus = math.exp(-x_minus) if not done_minus else 0.0
+
+        for m in range(0, n):
+            if not done_plus:
+                p_plus, g_plus, done_plus = _Gn_step(x_plus, m, n, p_plus, g_plus)
+            if not done_0:
+                p_0, g_0, done_0 = _Gn_step(x_0, m, n, p_0, g_0)
+            if not done_minus:
+                p_minus, g_minus, done_minus = _Gn_step(x_minus, m, n, p_minus, g_minus)
+            if done_plus and done_0 and done_minus:
+                break
+
+        h_plus = _h_from_Gn(k + 1, n, g_plus, td, tb, tau)
+        h_0 = _h_from_Gn(k, n, g_0, td, tb, tau) if factor_0 >= 0 else 0.0
+        h_minus = _h_from_Gn(k - 1, n, g_minus, td, tb, tau) if factor_minus >= 0 else 0.0
+
+        s += h_plus - 2 * h_0 + h_minus
+
+    return s
+
+
+def _Gn_array(x, n):
+    """Term in Eq. 34 in Zhang+95, for arrays of x and n.
 
-    return val
+    The sum can be expressed through the regularized upper incomplete gamma function,
+    as :math:`G_n(x) = n Q(n, x) - x Q(n - 1, x)`, since :math:`Q(n, x)` is the
+    cumulative Poisson probability of having less than :math:`n` events.
+    """
+    # Q(0, x) is 0 for x > 0 (and undefined for x = 0), so that term only contributes for n > 1
+    second_term = x * gammaincc(np.maximum(n - 1, 1), x)
+    return n * gammaincc(n, x) - np.where(n > 1, second_term, 0.0)
+
+
+def _precompute_h_table(kmax, nmax, td, tb, tau):
+    """Calculate the terms in Eq. 35 in Zhang+95 for k in 0..kmax+1 and n in 1..nmax-1.
+
+    The value of :math:`h(k, n)` is stored in ``H[k, n]``. The terms are zero for
+    :math:`n t_d > k t_b`, so ``nmax`` only needs to be a little larger than
+    :math:`(k_{max} + 1) t_b / t_d`.
+    """
+    k_values = np.arange(kmax + 2)
+    # Number of values of n in 1..nmax-1 with n td <= k tb. One more is allowed to be
+    # safe against rounding, and discarded below if its h term is zero
+    n_counts = np.clip(np.floor(k_values * tb / td).astype(int) + 1, 0, nmax - 1)
+
+    # Only the (k, n) pairs in this triangle are calculated, not the full grid
+    k = np.repeat(k_values, n_counts)
+    n = np.arange(k.size) - np.repeat(np.cumsum(n_counts) - n_counts, n_counts) + 1
+
+    # Typo in Zhang+95 corrected. k * tb, not k * td
+    factor = k * tb - n * td
+    good = factor >= 0
+    k, n, factor = k[good], n[good], factor[good]
+
+    H = np.zeros((kmax + 2, nmax))
+    H[k, n] = k - n * (td + tau) / tb + tau / tb * _Gn_array(factor / tau, n)
+    return H
 
 
 INFINITE = 699
 
 
-@njit()
+@njit(cache=True)
 def A0(r0, td, tb, tau):
     """Term in Eq. 38 in Zhang+95.
 
@@ -161,13 +242,14 @@ def A0(r0, td, tb, tau):
         Inverse of the incident countrate
     """
     s = 0.0
-    for n in range(1, int(max(2, tb / td * 2 + 1))):
+    n_bound = _A0_n_bound(td, tb)
+    for n in range(1, n_bound):
         s += _h(1, n, td, tb, tau)
 
     return r0 * tb * (1 + 2 * s)
 
 
-@njit()
+@njit(cache=True)
 def A_single_k(k, r0, td, tb, tau):
     """Term in Eq. 39 in Zhang+95.
 
@@ -187,16 +269,50 @@ def A_single_k(k, r0, td, tb, tau):
     if k == 0:
         return A0(r0, td, tb, tau)
     # Equation 39
-    s = 0.0
+    return r0 * tb * _A_inner(k, td, tb, tau)
 
-    for n in range(1, int(max(3, (k + 1) * tb / td * 2))):
-        new_val = _h(k + 1, n, td, tb, tau) - 2 * _h(k, n, td, tb, tau) + _h(k - 1, n, td, tb, tau)
 
-        s += new_val
+@njit(fastmath=True, cache=True)
+def _A_from_h_table(k, H, r0, td, tb):
+    """Same as `A_single_k`, but using the values of h precomputed by `_precompute_h_table`."""
+    nmax = H.shape[1]
+    s = 0.0
+    if k == 0:
+        # Equation 38
+        n_bound = min(nmax, _A0_n_bound(td, tb))
+        for n in range(1, n_bound):
+            s += H[1, n]
+        return r0 * tb * (1 + 2 * s)
+
+    # Equation 39. All h terms are zero for n >= nmax
+    n_bound = min(nmax, _A_n_bound(k, td, tb))
+    for n in range(1, n_bound):
+        s += H[k + 1, n] - 2 * H[k, n] + H[k - 1, n]
 
     return r0 * tb * s
 
 
+def _k_array(k):
+    """Convert an iterable of k values to an array.
+
+    Arrays are returned as they are, and sequences (e.g. lists and tuples) are converted
+    directly. Other iterables (e.g. sets, dict views and generators) are not understood
+    by `np.asarray`, so they are first converted to a list.
+    """
+    if isinstance(k, (np.ndarray, Sequence)):
+        return np.asarray(k)
+    return np.asarray(list(k))
+
+
+@njit(parallel=True, cache=True)
+def _A_vec(k_arr, r0, td, tb, tau):
+    """Same as `A_single_k`, for an array of k values."""
+    out = np.empty(k_arr.size)
+    for i in prange(k_arr.size):
+        out[i] = A_single_k(k_arr[i], r0, td, tb, tau)
+    return out
+
+
 def A(k, r0, td, tb, tau):
     """Term in Eq. 39 in Zhang+95.
 
@@ -214,7 +330,7 @@ def A(k, r0, td, tb, tau):
         Inverse of the incident countrate
     """
     if isinstance(k, Iterable):
-        return np.array([A_single_k(ki, r0, td, tb, tau) for ki in k])
+        return _A_vec(_k_array(k), r0, td, tb, tau)
 
     return A_single_k(k, r0, td, tb, tau)
 
@@ -264,6 +380,8 @@ def check_A(rate, td, tb, max_k=100, save_to=None, linthresh=0.000001, rate_is_i
     rate_is_incident : bool, default True
         If True, the input rate is the incident count rate. If False, it is the detected one.
     """
+    import matplotlib.pyplot as plt
+
     if rate_is_incident:
         tau = 1 / rate
         r0 = r_det(td, rate)
@@ -289,18 +407,24 @@ def check_A(rate, td, tb, max_k=100, save_to=None, linthresh=0.000001, rate_is_i
     return k_values, A_values
 
 
-@njit()
-def _B_raw(k, r0, td, tb, tau):
-    """Term in Eq. 45 in Zhang+95."""
+@njit(cache=True)
+def _B_from_A(k, Ak, r0, tb):
+    """Term in Eq. 45 in Zhang+95, given the value of A for the same k."""
     if k == 0:
-        return 2 * (A_single_k(0, r0, td, tb, tau) - r0**2 * tb**2) / (r0 * tb)
+        return 2 * (Ak - r0**2 * tb**2) / (r0 * tb)
 
-    new_val = A_single_k(k, r0, td, tb, tau) - r0**2 * tb**2
+    new_val = Ak - r0**2 * tb**2
 
     return 4 * new_val / (r0 * tb)
 
 
-@njit()
+@njit(cache=True)
+def _B_raw(k, r0, td, tb, tau):
+    """Term in Eq. 45 in Zhang+95."""
+    return _B_from_A(k, A_single_k(k, r0, td, tb, tau), r0, tb)
+
+
+@njit(cache=True)
 def _safe_B_single_k(k, r0, td, tb, tau, limit_k=60):
     """Term in Eq. 39 in Zhang+95, with a cut in the maximum k.
 
@@ -311,13 +435,22 @@ def _safe_B_single_k(k, r0, td, tb, tau, limit_k=60):
     return _B_raw(k, r0, td, tb, tau)
 
 
+@njit(parallel=True, cache=True)
+def _safe_B_vec(k_arr, r0, td, tb, tau, limit_k=60):
+    """Same as `_safe_B_single_k`, for an array of k values."""
+    out = np.empty(k_arr.size)
+    for i in prange(k_arr.size):
+        out[i] = _safe_B_single_k(k_arr[i], r0, td, tb, tau, limit_k=limit_k)
+    return out
+
+
 def _safe_B(k, r0, td, tb, tau, limit_k=60):
     """Term in Eq. 39 in Zhang+95, with a cut in the maximum k.
 
     This can be risky. Only use if B is really 0 for high k.
     """
     if isinstance(k, Iterable):
-        return np.array([_safe_B_single_k(ki, r0, td, tb, tau, limit_k=limit_k) for ki in k])
+        return _safe_B_vec(_k_array(k), r0, td, tb, tau, limit_k=limit_k)
     return _safe_B_single_k(int(k), r0, td, tb, tau, limit_k=limit_k)
 
 
@@ -378,6 +511,8 @@ def check_B(rate, td, tb, max_k=100, save_to=None, linthresh=0.000001, rate_is_i
     rate_is_incident : bool, default True
         If True, the input rate is the incident count rate. If False, it is the detected one.
     """
+    import matplotlib.pyplot as plt
+
     if rate_is_incident:
         tau = 1 / rate
         r0 = r_det(td, rate)
@@ -407,24 +542,28 @@ def check_B(rate, td, tb, max_k=100, save_to=None, linthresh=0.000001, rate_is_i
     return k_values, B_values
 
 
-@njit(parallel=True)
-def _inner_loop_pds_zhang(N, tau, r0, td, tb, limit_k=60):
-    """Calculate the power spectrum, as per Eq. 44 in Zhang+95."""
-    P = np.zeros(N // 2)
-    for j in prange(N // 2):
-        eq8_sum = 0.0
+@njit(parallel=True, fastmath=True, cache=True)
+def _B_from_h_table(limit_k, H, r0, td, tb):
+    """Calculate :math:`B_k` for k in 0..limit_k-1 from the table of h terms."""
+    Bk = np.empty(limit_k)
+    for k in prange(limit_k):
+        Bk[k] = _B_from_A(k, _A_from_h_table(k, H, r0, td, tb), r0, tb)
+    return Bk
 
-        for k in range(1, min(N, limit_k)):
-            Bk = _safe_B_single_k(k, r0, td, tb, tau, limit_k=limit_k)
 
-            eq8_sum += (N - k) / N * Bk * np.cos(2 * np.pi * j * k / N)
+def _precompute_B(limit_k, r0, td, tb, tau):
+    """Calculate :math:`B_k` for all :math:`k` from 0 to ``limit_k - 1``.
 
-        P[j] = _safe_B_single_k(0, r0, td, tb, tau) + eq8_sum
+    Each :math:`A_k` uses the h terms of :math:`k - 1`, :math:`k` and :math:`k + 1`,
+    so these are calculated once and for all with `_precompute_h_table`.
+    """
+    nmax = int(limit_k * tb / td) + 2
+    H = _precompute_h_table(limit_k - 1, nmax, td, tb, tau)
 
-    return P
+    return _B_from_h_table(limit_k, H, r0, td, tb)
 
 
-def pds_model_zhang(N, rate, td, tb, limit_k=60, rate_is_incident=True):
+def pds_model_zhang(N, rate, td, tb, limit_k=60, rate_is_incident=True, dtype=np.float64):
     """Calculate the dead-time-modified power spectrum.
 
     Parameters
@@ -447,6 +586,12 @@ def pds_model_zhang(N, rate, td, tb, limit_k=60, rate_is_incident=True):
     rate_is_incident : bool, default True
         If True, the input rate is the incident count rate. If False, it is the
         detected count rate.
+    dtype : numpy dtype, default np.float64
+        Precision used for the Fourier transform of the :math:`B_k` terms, and of the
+        returned power. Only ``np.float32`` and ``np.float64`` are accepted. The
+        :math:`B_k` terms are always calculated in double precision. Use ``np.float32``
+        to save memory and time for large ``N``, at the cost of a relative precision
+        around 1e-7 in the power spectrum.
 
     Returns
     -------
@@ -455,6 +600,9 @@ def pds_model_zhang(N, rate, td, tb, limit_k=60, rate_is_incident=True):
     power : array of floats
         Power spectrum
     """
+    if np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError(f"dtype must be np.float32 or np.float64, not {np.dtype(dtype)}")
+
     if rate_is_incident:
         tau = 1 / rate
         r0 = r_det(td, rate)
@@ -464,16 +612,22 @@ def pds_model_zhang(N, rate, td, tb, limit_k=60, rate_is_incident=True):
 
     # Nph = N / tau
     logger.info("Calculating PDS model (update)")
-    P = _inner_loop_pds_zhang(N, tau, r0, td, tb, limit_k=limit_k)
+    Bk = _precompute_B(min(N, limit_k), r0, td, tb, tau)
+
+    # The sum over k in Eq. 44 is the real part of the discrete Fourier transform
+    # of the weighted B_k, so that it can be calculated for all frequencies at once
+    k = np.arange(1, Bk.size)
+    weighted_B = np.zeros(N, dtype=dtype)
+    weighted_B[1 : Bk.size] = (N - k) / N * Bk[1:]
+    # scipy.fft keeps single precision inputs in single precision, unlike numpy.fft
+    P = rfft(weighted_B)[: N // 2].real + Bk[0].astype(dtype)
     if tb > 10 * td:
         warnings.warn(
             f"The bin time is much larger than the dead time. "
             f" Calculations might be slow. tb={tb / td:.2f} * td"
         )
 
-    maxf = 0.5 / tb
-    df = maxf / len(P)
-    freqs = np.arange(len(P)) * df
+    freqs = np.linspace(0.0, 0.5 / tb, P.size, endpoint=False)
 
     return freqs, P
 
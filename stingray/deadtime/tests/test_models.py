@@ -2,11 +2,12 @@ import os
 import pytest
 import numpy as np
 from scipy.interpolate import interp1d
+from scipy.special import gammaincc
 
 from stingray.lightcurve import Lightcurve
 from stingray.powerspectrum import AveragedPowerspectrum
 from stingray.deadtime.model import r_det, r_in, pds_model_zhang, non_paralyzable_dead_time_model
-from stingray.deadtime.model import check_A, check_B, A, B
+from stingray.deadtime.model import check_A, check_B, A, B, _precompute_B, _Gn, PRECISION
 from stingray.filters import filter_for_deadtime
 from stingray.utils import HAS_NUMBA
 
@@ -77,6 +78,40 @@ def test_non_paralyzable_model_accurate(rates):
     assert np.isclose(np.mean(ratio), 1, rtol=0.01)
 
 
+@pytest.mark.parametrize(
+    "x, n",
+    [
+        (0.5, 1),
+        (10.0, 10),
+        (100.0, 120),
+        (720.0, 780),
+        (740.0, 800),
+        (744.0, 804),
+        (800.0, 900),
+        (2000.0, 2100),
+    ],
+)
+def test_Gn(x, n):
+    """Compare with the closed form in terms of the regularized upper incomplete gamma.
+
+    For x between ~708 and ~745, exp(-x) is a subnormal number; for larger x, it is zero.
+    """
+    expected = n * gammaincc(n, x) - x * gammaincc(n - 1, x)
+    assert np.isclose(_Gn(x, n), expected, rtol=1e-10)
+
+
+def test_A_large_x():
+    """A_k tends to r0^2 tb^2 for large k (Eq. 43 in Zhang+95).
+
+    With these parameters, the Gn terms of A_43 have x in the range where exp(-x) is subnormal.
+    """
+    td = 2.5e-3
+    tb = 0.1
+    rate = 300
+    r0 = r_det(td, rate)
+    assert np.isclose(A(43, r0, td, tb, 1 / rate), r0**2 * tb**2, rtol=1e-8)
+
+
 @pytest.mark.parametrize("is_incident", [True, False])
 def test_checkA(is_incident):
     check_A(300, 2.5e-3, 0.001, max_k=100, save_to="check_A.png", rate_is_incident=is_incident)
@@ -104,6 +139,65 @@ def test_A_and_B_array(tb):
     assert np.array_equal(
         np.array([B(k, r0, td, tb, tau) for k in ks]), B(ks, r0, td, tb, tau), equal_nan=False
     )
+    assert np.array_equal(A(ks, r0, td, tb, tau), A(list(ks), r0, td, tb, tau))
+    assert np.array_equal(B(ks, r0, td, tb, tau), B(tuple(ks.tolist()), r0, td, tb, tau))
+    assert np.array_equal(B(ks, r0, td, tb, tau), B((k for k in ks), r0, td, tb, tau))
+    k_set = set(ks.tolist())
+    assert np.array_equal(A(np.array(list(k_set)), r0, td, tb, tau), A(k_set, r0, td, tb, tau))
+    assert np.array_equal(B(np.array(list(k_set)), r0, td, tb, tau), B(k_set, r0, td, tb, tau))
+
+
+@pytest.mark.parametrize("tb", [0.0001, 0.1])
+def test_precomputed_B(tb):
+    td = 2.5e-3
+    limit_k = 70
+    rate = 10
+    tau = 1 / rate
+    r0 = r_det(td, rate)
+    assert np.allclose(
+        _precompute_B(limit_k, r0, td, tb, tau),
+        B(np.arange(limit_k), r0, td, tb, tau, limit_k=limit_k),
+        rtol=1e-8,
+        atol=1e-8,
+    )
+
+
+@pytest.mark.parametrize("N, rate, td, tb", [(256, 10.0, 2.5e-3, 0.1), (200, 2000.0, 1e-5, 1e-3)])
+def test_pds_model_against_direct_B(N, rate, td, tb):
+    """Compare with Eq. 44 in Zhang+95, summed directly over the B_k from `B`.
+
+    For tb >> td, the B_k have absolute errors up to the float error estimate of
+    `check_B`, max(tb / td, 1) * k^3 * 10^-PRECISION, coming from the cancellations
+    in the h terms. The tolerance is the sum of that estimate over all k.
+    """
+    limit_k = 60
+    with pytest.warns(UserWarning, match="The bin time is much larger than the "):
+        _, power = pds_model_zhang(N, rate, td, tb, limit_k=limit_k)
+
+    r0 = r_det(td, rate)
+    Bk = B(np.arange(limit_k), r0, td, tb, 1 / rate, limit_k=limit_k)
+    ks = np.arange(1, limit_k)
+    j = np.arange(N // 2)[:, np.newaxis]
+    expected = Bk[0] + np.sum((N - ks) / N * Bk[1:] * np.cos(2 * np.pi * j * ks / N), axis=1)
+
+    tolerance = np.sum(max(tb / td, 1) * 10.0 ** (3 * np.log10(ks) - PRECISION))
+    assert np.allclose(power, expected, rtol=0, atol=tolerance)
+
+
+def test_pds_model_float32():
+    freqs, power = pds_model_zhang(1000, 100.0, 2.5e-3, 0.0002, limit_k=200)
+    freqs32, power32 = pds_model_zhang(1000, 100.0, 2.5e-3, 0.0002, limit_k=200, dtype=np.float32)
+    assert np.array_equal(freqs, freqs32)
+    # The power would be upcast to double precision if the FFT did not run in single precision
+    assert power32.dtype == np.float32
+    assert power.dtype == np.float64
+    assert np.allclose(power, power32, rtol=1e-5)
+
+
+@pytest.mark.parametrize("dtype", [int, np.float16, np.complex128])
+def test_pds_model_bad_dtype(dtype):
+    with pytest.raises(ValueError, match="dtype must be np.float32 or np.float64"):
+        pds_model_zhang(1000, 100.0, 2.5e-3, 0.0002, limit_k=200, dtype=dtype)
 
 
 def test_pds_model_warns():
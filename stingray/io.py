@@ -10,7 +10,6 @@ import numpy as np
 from astropy.io import fits
 from astropy.table import Table
 from astropy.logger import AstropyUserWarning
-import matplotlib.pyplot as plt
 from astropy.io import fits as pf
 
 import stingray.utils as utils
@@ -973,6 +972,7 @@ def savefig(filename, **kwargs):
         ``matplotlib.pyplot``. For example use `bbox_inches='tight'` to
         remove the undesirable whitespace around the image.
     """
+    import matplotlib.pyplot as plt
 
     if not plt.fignum_exists(1):
         utils.simon(
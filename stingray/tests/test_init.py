@@ -0,0 +1,39 @@
+import importlib
+import logging
+
+import pytest
+
+import stingray
+
+
+@pytest.mark.parametrize("submodule", list(stingray._PUBLIC_NAMES))
+def test_public_names_match_submodules(submodule):
+    module = importlib.import_module(f"stingray.{submodule}")
+    if hasattr(module, "__all__"):
+        assert set(stingray._PUBLIC_NAMES[submodule]) == set(module.__all__)
+    for name in stingray._PUBLIC_NAMES[submodule]:
+        assert getattr(stingray, name) is getattr(module, name)
+
+
+def test_lazy_import_of_names():
+    from stingray import Lightcurve
+    from stingray.lightcurve import Lightcurve as Lightcurve_lc
+
+    assert Lightcurve is Lightcurve_lc
+    assert "Lightcurve" in dir(stingray)
+
+
+def test_logger_is_set_up():
+    from stingray import logger
+
+    assert isinstance(logger, logging.Logger)
+    assert stingray.logger is importlib.import_module("stingray.loggingconfig").logger
+
+
+def test_lazy_import_of_submodules():
+    assert stingray.gti is importlib.import_module("stingray.gti")
+
+
+def test_missing_attribute():
+    with pytest.raises(AttributeError, match="has no attribute 'bububu'"):
+        stingray.bububu
@@ -146,7 +146,7 @@ __all__ = [
 
 @njit()
 def heaviside(x):
-    """Heaviside function. Returns 1 if x>0, and 0 otherwise.
+    """Heaviside function. Returns 1 if x>=0, and 0 otherwise.
 
     Examples
     --------
@@ -155,10 +155,7 @@ def heaviside(x):
     >>> heaviside(-1)
     0
     """
-    if x >= 0:
-        return 1
-    else:
-        return 0
+    return int(x >= 0)
 
 
 @njit